@@ -6,9 +6,11 @@ tunein directory at http://opml.radiotime.com/).
 Uses `mpv' to play streams. Works for any stream which works when invoked
 as `$mpv <stream-location>'.
 
-A favourites file (also stored as OPML) is written to
-`$XDG_DATA_HOME/curseradio_improved/favourites.opml'.
+A favourites file is written to
+`$XDG_DATA_HOME/curseradio_improved/favourites.json', and can be exported as
+OPML to `$XDG_DATA_HOME/curseradio_improved/favourites.opml'.
 """
+import concurrent.futures
 import curses
 import json
 import pathlib
@@ -18,53 +20,132 @@ from os import path
 import lxml.etree
 import requests
 import xdg.BaseDirectory
+from requests.adapters import HTTPAdapter
 
 
 class OPMLNode:
     """
     Represents an OPML <outline> element. Only instantiate subclasses.
     """
+    # used for all HTTP requests; OPMLBrowser replaces this with a pooled
+    # session so connections are kept alive between fetches
+    session = requests
+    # seconds to wait for a server to connect or send data, so a stalled
+    # fetch can't block loading (or exiting) indefinitely
+    timeout = 10
+
     @classmethod
     def from_xml(cls, url, text="", attr=None):
         """
         Load an OPML XML file. Returns a fake parent OPMLOutline node with
         children set to all the outlines contained in the file. (The header
         is currently discarded).
+
+        The document is parsed incrementally: the attributes of each
+        <outline> are collected as soon as it is closed and the element is
+        then discarded, so the full lxml tree is never held in memory. Nodes
+        are only built once they are accessed, see `OPMLOutline.children'.
+        """
+        if attr is None:
+            attr = {}
+        result = cls(text=text, attr=attr)
+        if url.startswith(("http://", "https://")):
+            with cls.session.get(url, stream=True, timeout=cls.timeout) as r:
+                r.raise_for_status()
+                r.raw.decode_content = True
+                result._raw_children = cls._parse_stream(r.raw)
+        else:
+            result._raw_children = cls._parse_stream(url)
+        return result
+
+    @staticmethod
+    def _parse_stream(source):
+        """
+        Stream-parse the OPML document `source' (a file name or file-like
+        object) and return its toplevel outlines as unconverted
+        `(attr, children)' tuples.
+        """
+        # one list of collected children per currently open <outline>
+        stack = [[]]
+        for event, elem in lxml.etree.iterparse(
+                source, events=("start", "end"), tag="outline"):
+            if event == "start":
+                stack.append([])
+                continue
+            # the element is cleared below, so the attributes must be copied;
+            # items() does that in a single pass, unlike the `attrib' proxy
+            children = stack.pop()
+            stack[-1].append((dict(elem.items()), children))
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        return stack[0]
+
+    @classmethod
+    def from_json(cls, items, text="", attr=None):
+        """
+        Counterpart to `from_xml' for a list of outlines as returned by
+        `to_json'. Returns a fake parent node with the outlines as children.
         """
         if attr is None:
             attr = {}
-        tree = lxml.etree.parse(url)
         result = cls(text=text, attr=attr)
-        result.children = [OPMLNode.from_element(o)
-                           for o in tree.xpath("/opml/body/outline")]
+        result.children = [node for node in map(OPMLNode.from_dict, items)
+                           if node is not None]
         return result
 
     @classmethod
-    def from_element(cls, element):
+    def from_dict(cls, item):
+        """
+        Converts a single outline as returned by `to_dict' (and its
+        descendants) into the appropriate OPMLOutline subclass, see
+        `from_attrib'.
+        """
+        children = [cls.from_dict(child)
+                    for child in item.get("children", ())]
+        return cls.from_attrib(dict(item["attr"]),
+                               [c for c in children if c is not None])
+
+    @staticmethod
+    def from_raw(item):
         """
-        Converts a single <outline> node into the appropriate OPMLOutline
-        subclass depending on attributes. Currently detects only plain
+        Converts an `(attr, children)' tuple as collected by `_parse_stream'
+        into the appropriate OPMLOutline subclass. The children are only
+        converted when first accessed, see `from_attrib'.
+        """
+        attr, children = item
+        return OPMLNode.from_attrib(attr, children, lazy=True)
+
+    @staticmethod
+    def from_attrib(attr, children, lazy=False):
+        """
+        Build the appropriate OPMLOutline subclass from the attributes of an
+        <outline> element and its already converted child nodes (or, if
+        `lazy' is set, the unconverted tuples from `_parse_stream', which
+        an outline converts on first access). Currently detects only plain
         outlines (simple folders), links (deferred folders) and audio leaf
-        elements.
+        elements; returns None for anything else. Children of links and
+        audio elements are ignored.
 
         TODO: Support other leaf element types.
         """
-        text = element.get("text")
-        attr = dict(element.attrib)
+        text = attr.get("text")
         type = attr.get("type", None)
-        if type is None and len(element) > 0:
+        if type is None and children:
             type = "outline"
 
         if type == "outline":
             node = OPMLOutline(text=text, attr=attr)
-            for child in element.xpath("./outline"):
-                node.children.append(cls.from_element(child))
+            if lazy:
+                node._raw_children = children
+            else:
+                node.children = children
         elif type == "link":
             node = OPMLOutlineLink(text=text, attr=attr)
-            assert len(element) == 0
         elif type == "audio":
             node = OPMLAudio(text=text, attr=attr)
-            assert len(element) == 0
+        else:
+            node = None
         return node
 
     def __init__(self, text, attr):
@@ -111,6 +192,19 @@ class OPMLNode:
         body.append(self.to_element())
         return opml
 
+    def to_dict(self):
+        """
+        Return the object and its children as JSON-serializable data.
+        """
+        return {"attr": self.attr}
+
+    def to_json(self):
+        """
+        Return a list of outlines (containing just this one) suitable for
+        `json.dump'.
+        """
+        return [self.to_dict()]
+
 
 class OPMLAudio(OPMLNode):
     """
@@ -134,33 +228,64 @@ class OPMLAudio(OPMLNode):
             self.secondary = attr["subtext"]
         else:
             self.secondary = ""
+        self._rendered = (self.text, self.secondary,
+                          "{}k".format(self.bitrate),
+                          '|'*(self.reliability//20))
 
     def activate(self):
         yield "Fetching playlist"
-        r = requests.get(self.url)
-        playlist = r.text.split('\n')[0]
+        # playlists are small, so the whole body is read: closing a partly
+        # read response would drop the connection instead of keeping it
+        # alive in the session's pool. Only the first line is decoded.
+        r = self.session.get(self.url, timeout=self.timeout)
+        if r.encoding is None:
+            r.encoding = "utf-8"
+        playlist = next(r.iter_lines(decode_unicode=True), "")
         yield [playlist]
 
     def render(self, open_delim, close_delim):
         """
         Called for every audio leave node on drawing. `open_delim' and
-        `close_delim' are not used.
+        `close_delim' are not used. The text is formatted once at creation.
         """
-        return (self.text, self.secondary,
-                "{}k".format(self.bitrate), '|'*(self.reliability//20))
+        return self._rendered
 
 
 class OPMLOutline(OPMLNode):
     """
-    Simple branch-level element, filled from the host file at creation time.
+    Simple branch-level element. Its children come from the host file, but
+    when loaded by `from_xml' they are only built on first access.
     """
 
     def __init__(self, text, attr):
         self.text = text
         self.attr = attr
         self.children = []
+        self._raw_children = None
         self.collapsed = True
         self.leaf = False
+        self._rendered_open = None
+        self._rendered_close = None
+
+    @property
+    def children(self):
+        """
+        Child nodes. Outlines loaded by `from_xml' keep their children
+        unconverted until they are first needed here, so subtrees that are
+        never opened don't cost a node object per outline.
+        """
+        if self._raw_children is not None:
+            self._children = [node
+                              for node in map(OPMLNode.from_raw,
+                                              self._raw_children)
+                              if node is not None]
+            self._raw_children = None
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        self._children = children
+        self._raw_children = None
 
     def activate(self):
         self.collapsed = not self.collapsed
@@ -176,14 +301,17 @@ class OPMLOutline(OPMLNode):
     def render(self, open_delim, close_delim):
         """
         Render display text, respecting the edge case of the tree root.
+        Both variants are formatted on first use and cached, since the
+        delimiters come from the (static) configuration.
         """
-        if self.text != "":
-            return ("{} {}".format(
-                open_delim if self.collapsed else close_delim, self.text
-            ), "", "", "")
-        else:
-            return ("{}".format(open_delim if self.collapsed else close_delim),
-                    "", "", "")
+        if self._rendered_open is None:
+            if self.text != "":
+                label = " {}".format(self.text)
+            else:
+                label = ""
+            self._rendered_open = (open_delim + label, "", "", "")
+            self._rendered_close = (close_delim + label, "", "", "")
+        return self._rendered_open if self.collapsed else self._rendered_close
 
     def to_element(self):
         elem = super().to_element()
@@ -191,6 +319,11 @@ class OPMLOutline(OPMLNode):
             elem.append(c.to_element())
         return elem
 
+    def to_dict(self):
+        item = super().to_dict()
+        item["children"] = [c.to_dict() for c in self.children]
+        return item
+
 
 class OPMLOutlineLink(OPMLOutline):
     """
@@ -202,11 +335,33 @@ class OPMLOutlineLink(OPMLOutline):
         super().__init__(text, attr)
         self.url = attr["URL"]
         self.ready = False
+        self._future = None
+
+    def prefetch(self, pool):
+        """
+        Start loading the children in the background on executor `pool',
+        so that a later activation doesn't have to wait for the network.
+        Returns the new future, or None if nothing was submitted.
+        """
+        if not self.ready and self._future is None:
+            self._future = pool.submit(OPMLOutline.from_xml, self.url)
+            return self._future
+        return None
 
     def activate(self):
         if not self.ready:
             yield "Loading {}".format(self.url)
-            fakeroot = OPMLOutline.from_xml(self.url)
+            fakeroot = None
+            # a prefetch still queued behind others is dropped in favour of
+            # loading right away; one that has started is waited for
+            if self._future is not None and not self._future.cancel():
+                try:
+                    fakeroot = self._future.result()
+                except Exception:
+                    pass  # retry below, so errors surface as before
+            self._future = None
+            if fakeroot is None:
+                fakeroot = OPMLOutline.from_xml(self.url)
             self.children = fakeroot.children
             self.ready = True
             yield "Loading... done"
@@ -242,6 +397,12 @@ class OPMLFavourites(OPMLOutline):
             body.append(c.to_element())
         return opml
 
+    def to_json(self):
+        """
+        As with `to_xml', only the favourite items themselves are included.
+        """
+        return [c.to_dict() for c in self.children]
+
 
 class OPMLBrowser:
     """
@@ -256,18 +417,31 @@ class OPMLBrowser:
         """
         self.config = self.load_config()
         self.keymap = self.get_keymap()
+        self.session = self.make_session()
+        OPMLNode.session = self.session
         self.root = OPMLOutline.from_xml(self.config['opml']['root'])
         self.root.collapsed = False
-        self.favourites = self.load_favourites()
+        self.favourites, self._fav_path = self.load_favourites()
         self.root.children.insert(0, self.favourites)
         self.screen = screen
         self.selected = self.root
         self.cursor = 0
         self.top = 0
-        self.flat = self.root.flatten([])
+        self.flat = []
+        self._flat_dirty = True  # tree structure changed, `flat' is stale
         self.maxy, self.maxx = self.screen.getmaxyx()
         self.child = None
+        self.stopped_children = []  # terminated, but not yet reaped
         self.status = ""
+        self.message = None  # shown instead of the status until next key
+        self._prefetch_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=2)
+        self._prefetches = set()  # futures of prefetches not yet finished
+
+        # what is currently on screen, so `display' only redraws changes
+        self._drawn_size = None
+        self._drawn_rows = []
+        self._drawn_status = None
 
         # UI settings
         self.xmargin = 1
@@ -281,22 +455,73 @@ class OPMLBrowser:
 
         curses.curs_set(0)  # hide cursor
         self.init_colors()  # initialize colors
-        self.display()  # display starting screen
-        self.interact()  # main loop
+        try:
+            self.interact()  # main loop
+        finally:
+            # also on errors or Ctrl-C, so no player is left running
+            self.stop_players()
 
     def load_favourites(self):
+        """
+        Load the favourites from the first XDG data directory containing
+        them. Favourites are stored as JSON; an OPML file as written by
+        older versions is read if there is no JSON file and converted on
+        the next save. Returns the favourites and the file to save them
+        to, which is None unless they were loaded from the user's own data
+        directory (then `save_favourites' doesn't need to look it up again).
+        """
+        home = path.join(xdg.BaseDirectory.xdg_data_home,
+                         "curseradio_improved")
         for p in xdg.BaseDirectory.load_data_paths("curseradio_improved"):
+            jsonpath = pathlib.Path(p, "favourites.json")
             opmlpath = pathlib.Path(p, "favourites.opml")
-            if opmlpath.exists():
-                return OPMLFavourites.from_xml(str(opmlpath))
-        return OPMLFavourites("", {})
+            if jsonpath.exists():
+                with open(jsonpath) as f:
+                    favourites = OPMLFavourites.from_json(json.load(f))
+            elif opmlpath.exists():
+                favourites = OPMLFavourites.from_xml(str(opmlpath))
+                favourites.dirty = True
+            else:
+                continue
+            return favourites, jsonpath if p == home else None
+        return OPMLFavourites("", {}), None
 
     def save_favourites(self):
-        path = xdg.BaseDirectory.save_data_path("curseradio_improved")
         if self.favourites.dirty:
-            opmlpath = pathlib.Path(path, "favourites.opml")
-            opml = lxml.etree.ElementTree(self.favourites.to_xml())
-            opml.write(str(opmlpath))
+            jsonpath = self._fav_path
+            if jsonpath is None:
+                jsonpath = pathlib.Path(
+                    xdg.BaseDirectory.save_data_path("curseradio_improved"),
+                    "favourites.json")
+            with open(jsonpath, "w") as fh:
+                json.dump(self.favourites.to_json(), fh)
+
+    def export_favourites(self):
+        """
+        Write the favourites as an OPML file next to the JSON file and
+        report where it went (or why it failed).
+        """
+        try:
+            opmlpath = pathlib.Path(
+                xdg.BaseDirectory.save_data_path("curseradio_improved"),
+                "favourites.opml")
+            with open(opmlpath, "wb") as fh:
+                fh.write(lxml.etree.tostring(self.favourites.to_xml()))
+        except OSError as e:
+            self.message = "Exporting favourites failed: {}".format(e)
+        else:
+            self.message = "Exported favourites to {}".format(opmlpath)
+
+    def make_session(self):
+        """
+        Create the HTTP session shared by all OPML and playlist fetches.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["Accept-Encoding"] = "gzip"
+        return session
 
     def load_config(self, name="configs.json"):
         """
@@ -314,7 +539,7 @@ class OPMLBrowser:
         for key in (
                 "up", "up_vi", "down", "down_vi", "start", "start_vi", "end",
                 "end_vi", "pageup", "pageup_vi", "pagedown", "pagedown_vi",
-                "enter", "stop", "exit", "favourite"
+                "enter", "stop", "exit", "favourite", "export"
         ):
             value = self.config["keymap"][key]
             if value.startswith("KEY_"):
@@ -328,8 +553,15 @@ class OPMLBrowser:
         Initialize curses colors.
         """
         self.colors = {}
-        for i in range(curses.COLORS):
-            curses.init_pair(i + 1, i, -1)
+
+        # foreground colors on the default background; only the pairs
+        # used below are initialized
+        for i, color in enumerate((
+                curses.COLOR_BLACK, curses.COLOR_RED, curses.COLOR_GREEN,
+                curses.COLOR_YELLOW, curses.COLOR_BLUE, curses.COLOR_MAGENTA,
+                curses.COLOR_CYAN
+        )):
+            curses.init_pair(i + 1, color, -1)
         self.colors["white"] = curses.color_pair(0)
         self.colors["black"] = curses.color_pair(1)
         self.colors["red"] = curses.color_pair(2)
@@ -360,13 +592,11 @@ class OPMLBrowser:
         Draw an outline around the UI.
         """
         color = self.colors[self.config["outline-color"]]
-        self.screen.addstr(0, 0, "┌", color)
-        self.screen.addstr(0, self.maxx-1, "┐", color)
-        self.screen.addstr(self.maxy-2, self.maxx-1, "┘", color)
-        self.screen.addstr(self.maxy-2, 0, "└", color)
-        for i in range(1, self.maxx-1):
-            self.screen.addstr(0, i, "─", color)
-            self.screen.addstr(self.maxy-2, i, "─", color)
+        hline = "─"*(self.maxx-2)
+        self.screen.addstr(0, 0, "┌" + hline + "┐", color)
+        self.screen.addstr(self.maxy-2, 0, "└" + hline + "┘", color)
+        # `vline' only takes single-byte characters, so the box-drawing
+        # sides still go one row at a time
         for i in range(1, self.maxy-2):
             self.screen.addstr(i, 0, "│", color)
             self.screen.addstr(i, self.maxx-1, "│", color)
@@ -376,136 +606,272 @@ class OPMLBrowser:
         self.screen.addstr(0, self.maxx//2-len(title)//2, title,
                            self.colors[self.config["title-color"]])
 
-    def display(self, msg=None):
+    def update_flat(self):
         """
-        Redraw the screen, possibly showing a message or the status bar.
+        Rebuild the flattened menu list if the tree structure has changed
+        since it was last built.
         """
-        self.screen.clear()
+        if self._flat_dirty:
+            self.flat = self.root.flatten([])
+            self._flat_dirty = False
 
-        width0 = 6*(self.maxx - 10)//10
-        width1 = 4*(self.maxx - 10)//10
+    def update_flat_at(self, index):
+        """
+        Update the rows below the branch at `index' of the flattened list
+        after it has been expanded or collapsed, without re-flattening the
+        whole tree.
+        """
+        if self._flat_dirty:
+            return  # a full rebuild is pending anyway
+        obj, depth = self.flat[index]
+        end = index + 1
+        while end < len(self.flat) and self.flat[end][1] > depth:
+            end += 1
+        self.flat[index+1:end] = obj.flatten([], depth)[1:]
+
+    def display(self, msg=None):
+        """
+        Redraw the screen, possibly showing a message or the status bar.
+        Changes are only staged; the caller flushes them to the terminal
+        with `curses.doupdate'.
+        """
+        self.update_flat()
+        # hot values used for every row, bound to locals once
+        maxy, maxx = self.maxy, self.maxx
+        xmargin, ymargin = self.xmargin, self.ymargin
+        status_ymargin = self.status_ymargin
+        addstr = self.screen.addstr
+
+        # the border only changes on resize, everything else is redrawn
+        # row by row when its content differs from what is on screen
+        if self._drawn_size != (maxy, maxx):
+            self.screen.clear()
+            self.draw_outline()
+            self._drawn_size = (maxy, maxx)
+            self._drawn_rows = []
+            self._drawn_status = None
+        blank = " "*(maxx-2)
+
+        width0 = 6*(maxx - 10)//10
+        width1 = 4*(maxx - 10)//10
+        # the last column must not reach into the right border, which is
+        # not redrawn here
+        width3 = max(0, min(5, maxx-1-(width0+width1+5)))
 
         # the color of a selected item, message and the status bar
         selected_style = self.colors[self.config["colors"]["selected-item"]]
         msg_style = self.colors[self.config["colors"]["message"]]
         status_style = self.colors[self.config["colors"]["statusbar"]]
+        opened_delimiter = self.config["opened_delimiter"]
+        closed_delimiter = self.config["closed_delimiter"]
+        cursor = self.cursor
 
-        self.draw_outline()
-
-        showobjs = self.flat[self.top:self.top+self.maxy-self.status_ymargin-2]
+        showobjs = self.flat[self.top:self.top+maxy-status_ymargin-2]
+        rows = []
         for i, (obj, depth) in enumerate(showobjs):
-            text = obj.render(
-                self.config["opened_delimiter"],
-                self.config["closed_delimiter"]
-            )
-            style = selected_style if i == self.cursor else curses.A_NORMAL
-            self.screen.addstr(i+self.ymargin, depth*2+self.xmargin,
-                               text[0][:width0-depth*2], style)
-            self.screen.addstr(i+self.ymargin, width0+2, text[1][:width1-4])
-            self.screen.addstr(i+self.ymargin, width0+width1, text[2][:4])
-            self.screen.addstr(i+self.ymargin, width0+width1+5, text[3][:5])
-
+            text = obj.render(opened_delimiter, closed_delimiter)
+            style = selected_style if i == cursor else curses.A_NORMAL
+            rows.append((depth, text, style))
+
+        drawn = self._drawn_rows
+        for i in range(max(len(rows), len(drawn))):
+            row = rows[i] if i < len(rows) else None
+            if i < len(drawn) and drawn[i] == row:
+                continue
+            y = i + ymargin
+            addstr(y, xmargin, blank)
+            if row is None:
+                continue
+            depth, text, style = row
+            addstr(y, depth*2+xmargin, text[0][:width0-depth*2], style)
+            addstr(y, width0+2, text[1][:width1-4])
+            addstr(y, width0+width1, text[2][:4])
+            addstr(y, width0+width1+5, text[3][:width3])
+        self._drawn_rows = rows
+
+        # clipped to stay inside the border, which is not redrawn here
+        status_xmargin = self.status_xmargin
+        status_width = maxx - status_xmargin - 1
         if msg is not None:
-            self.screen.addstr(self.maxy-self.status_ymargin,
-                               0+self.status_xmargin,
-                               msg[:self.maxx-1], msg_style)
+            status = (msg[:status_width], msg_style)
         else:
-            self.screen.addstr(self.maxy-self.status_ymargin,
-                               0+self.status_xmargin,
-                               self.status[:self.maxx-1], status_style)
+            status = (self.status[:status_width], status_style)
+        if status != self._drawn_status:
+            addstr(maxy-status_ymargin, 1, blank)
+            addstr(maxy-status_ymargin, status_xmargin, *status)
+            self._drawn_status = status
 
-        self.screen.refresh()
-        curses.doupdate()
+        self.screen.noutrefresh()
 
     def move(self, rel=None, to=None):
         """
         Recalculate screen scrolling after movement.
         """
+        self.update_flat()
+        flat = self.flat
+        top = self.top
+        last_row = self.maxy - 3 - self.status_ymargin
+
         # determine where to go to
         if to is not None:
             if to == "start":
                 target = 0
             elif to == "end":
-                target = len(self.flat) - 1
+                target = len(flat) - 1
         elif rel is not None:
-            target = self.top + self.cursor + rel
+            target = top + self.cursor + rel
 
         # check bounds of `target'
-        target = min(target, len(self.flat)-1)
+        target = min(target, len(flat)-1)
         target = max(target, 0)
-        self.selected = self.flat[target][0]
+        selected = self.selected = flat[target][0]
+        if isinstance(selected, OPMLOutlineLink):
+            future = selected.prefetch(self._prefetch_pool)
+            if future is not None:
+                self._prefetches.add(future)
+                future.add_done_callback(self._prefetches.discard)
 
         # reached upper bound
-        if target < self.top:
+        if target < top:
             self.top = target
             self.cursor = 0
         # reached lower bound
-        elif target > self.top + self.maxy - 3 - self.status_ymargin:
-            self.top = target - (self.maxy - 3 - self.status_ymargin)
-            self.cursor = self.maxy - 3 - self.status_ymargin
+        elif target > top + last_row:
+            self.top = target - last_row
+            self.cursor = last_row
         # moving within bounds
         else:
-            self.cursor = target - self.top
+            self.cursor = target - top
+
+    def get_actions(self):
+        """
+        Map every bound key code to its action. Built once, so the main
+        loop needs a single lookup per key press instead of comparing the
+        key against the whole keymap. If a key is bound twice, the first
+        binding listed here wins.
+        """
+        keymap = self.keymap
+        bindings = (
+            ((curses.KEY_RESIZE,), self.resize),
+            ((keymap["up"], keymap["up_vi"]), lambda: self.move(rel=-1)),
+            ((keymap["down"], keymap["down_vi"]), lambda: self.move(rel=1)),
+            ((keymap["start"], keymap["start_vi"]),
+             lambda: self.move(to="start")),
+            ((keymap["end"], keymap["end_vi"]), lambda: self.move(to="end")),
+            ((keymap["pageup"], keymap["pageup_vi"]),
+             lambda: self.move(rel=-self.maxy)),
+            ((keymap["pagedown"], keymap["pagedown_vi"]),
+             lambda: self.move(rel=self.maxy)),
+            ((keymap["enter"], ord('\n')), self.activate),
+            ((keymap["exit"],), self.exit),
+            ((keymap["stop"],), self.stop),
+            ((keymap["favourite"],), self.toggle_favourite),
+            ((keymap["export"],), self.export_favourites),
+        )
+        actions = {}
+        for keys, action in bindings:
+            for key in keys:
+                actions.setdefault(key, action)
+        return actions
+
+    def resize(self):
+        """
+        Pick up the new terminal size.
+        """
+        self.maxy, self.maxx = self.screen.getmaxyx()
+
+    def activate(self):
+        """
+        Activate the selected item, showing progress messages and starting
+        playback if it yields a command.
+        """
+        for msg in self.selected.activate():
+            if isinstance(msg, str):
+                self.display(msg=msg)
+                curses.doupdate()  # show it before blocking on the action
+            elif isinstance(msg, list):  # command to run
+                self.stop()
+
+                command = [self.config['playback']['command']] + msg
+                self.child = subprocess.Popen(
+                    command, stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL
+                )
+                self.status = self.config["statusbar-text"].format(
+                    self.selected.text)
+
+        if not self.selected.leaf:
+            # favourites hold the same node objects as the main tree, so a
+            # node may be listed twice while they are expanded; then every
+            # occurrence has to be updated
+            if self.favourites.collapsed:
+                self.update_flat_at(self.top + self.cursor)
+            else:
+                self._flat_dirty = True
+            self.move(rel=0)
+
+    def stop(self):
+        """
+        Stop playback, if any. The player is not waited for here; it is
+        reaped from the main loop once it has exited.
+        """
+        if self.child is not None:
+            self.child.terminate()
+            self.stopped_children.append(self.child)
+            self.child = None
+            self.status = ""
+
+    def stop_players(self):
+        """
+        Stop playback and give all stopped players a moment to exit.
+        """
+        self.stop()
+        for child in self.stopped_children:
+            try:
+                child.wait(timeout=0.5)
+            except subprocess.TimeoutExpired:
+                pass  # don't hang on a player that won't quit
+
+    def exit(self):
+        """
+        Save state before leaving the main loop (playback is stopped once
+        the main loop has ended). Returns True to signal the main loop to
+        end.
+        """
+        self.save_favourites()
+        # queued prefetches would otherwise still run before the process
+        # can exit (`cancel_futures' needs Python 3.9)
+        for future in list(self._prefetches):
+            future.cancel()
+        self._prefetch_pool.shutdown(wait=False)
+        return True
+
+    def toggle_favourite(self):
+        """
+        Add the selected item to the favourites or remove it.
+        """
+        self.favourites.toggle(self.selected)
+        if not self.favourites.collapsed:
+            self._flat_dirty = True
+            self.move(rel=0)
 
     def interact(self):
         """
         Main loop. Listen for keyboard input and respond.
         """
+        actions = self.get_actions()
         while True:
-            ch = self.screen.getch()
-            if ch == curses.KEY_RESIZE:
-                self.maxy, self.maxx = self.screen.getmaxyx()
-            elif ch == self.keymap["up"] or ch == self.keymap["up_vi"]:
-                self.move(rel=-1)
-            elif ch == self.keymap["down"] or ch == self.keymap["down_vi"]:
-                self.move(rel=1)
-            elif ch == self.keymap["start"] or ch == self.keymap["start_vi"]:
-                self.move(to="start")
-            elif ch == self.keymap["end"] or ch == self.keymap["end_vi"]:
-                self.move(to="end")
-            elif ch == self.keymap["pageup"] or ch == self.keymap["pageup_vi"]:
-                self.move(rel=-self.maxy)
-            elif ch == self.keymap["pagedown"] or ch == self.keymap[
-                "pagedown_vi"
-            ]:
-                self.move(rel=self.maxy)
-            elif ch == self.keymap["enter"] or ch == ord('\n'):
-                for msg in self.selected.activate():
-                    if isinstance(msg, str):
-                        self.display(msg=msg)
-                    elif isinstance(msg, list):  # command to run
-                        if self.child is not None:
-                            self.child.terminate()
-                            self.child.wait()
-
-                        command = [self.config['playback']['command']] + msg
-                        self.child = subprocess.Popen(
-                            command, stdout=subprocess.DEVNULL,
-                            stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL
-                        )
-                        self.status = self.config["statusbar-text"].format(
-                            self.selected.text)
-
-                self.flat = self.root.flatten([])
-                self.move(rel=0)
-            elif ch == self.keymap["exit"]:
-                if self.child is not None:
-                    self.child.terminate()
-                    self.child.wait()
-                self.save_favourites()
+            self.display(msg=self.message)  # render the new screen
+            curses.doupdate()
+            self.message = None
+
+            action = actions.get(self.screen.getch())
+            if action is not None and action():
                 return
-            elif ch == self.keymap["stop"]:
-                if self.child is not None:
-                    self.child.terminate()
-                    self.child.wait()
-            elif ch == self.keymap["favourite"]:
-                self.favourites.toggle(self.selected)
-                self.flat = self.root.flatten([])
-                self.move(rel=0)
 
             if self.child is not None:
                 if self.child.poll() is not None:
                     self.child = None
                     self.status = ""
-
-            self.display()  # render the new screen
+            self.stopped_children = [c for c in self.stopped_children
+                                     if c.poll() is None]